@@ -1,3 +1,6 @@
+# Start measuring the startup time as early as possible
+import src.startup  # noqa: F401, I001
+
 # Copy logger from uvicorn
 import logging
 
@@ -5,12 +5,22 @@ from src.prepare import BASE_DIR, prepare
 
 os.chdir(BASE_DIR)
 
+# Get arguments from command
+args = sys.argv[1:]
+
+if "--production" in args:
+    args.remove("--production")
+    from gunicorn.app.wsgiapp import run
+
+    sys.argv = ["gunicorn", "--config", "python:src.api.gunicorn_conf", *args, "src.api.app:app"]
+    print(f"🚀 Starting Gunicorn server: '{" ".join(sys.argv)}'")
+    run()
+    sys.exit()
+
 prepare()
 
 import uvicorn  # noqa: E402
 
-# Get arguments from command
-args = sys.argv[1:]
 extended_args = [
     "src.api.app:app",
     "--use-colors",
@@ -0,0 +1,180 @@
+"""
+Admission control: per-worker concurrency limits for groups of routes, with load shedding by queueing delay.
+
+Under overload, requests beyond the limit wait in a queue instead of piling up on the database pool and the event loop.
+A request that would wait too long is rejected right away with 503 and `Retry-After`,
+so clients (and load balancers) can retry another worker while the admitted requests keep a low latency.
+"""
+
+__all__ = ["AdmissionGroup", "AdmissionMiddleware"]
+
+import asyncio
+import time
+from collections import deque
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.metrics import metrics
+
+QUEUE_DELAY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+in_flight_requests = metrics.gauge(
+    "admission_in_flight_requests",
+    "Number of admitted requests being handled",
+    ("group",),
+)
+queued_requests = metrics.gauge(
+    "admission_queued_requests",
+    "Number of requests waiting for admission",
+    ("group",),
+)
+shed_requests = metrics.counter(
+    "admission_shed_requests_total",
+    "Number of requests rejected with 503 under overload",
+    ("group", "reason"),
+)
+queue_delay = metrics.histogram(
+    "admission_queue_delay_seconds",
+    "Time admitted requests waited for a free slot",
+    ("group",),
+    QUEUE_DELAY_BUCKETS,
+)
+
+
+class AdmissionGroup:
+    """
+    Requests with paths under `path_prefixes`, handled at most `max_concurrency` at once (0 for no limit).
+
+    Waiting requests are admitted in order of arrival. New requests are rejected right away while the oldest
+    waiting request has waited longer than `target_queue_delay`, and waiting ones after `max_queue_delay`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path_prefixes: list[str],
+        max_concurrency: int,
+        target_queue_delay: float,
+        max_queue_delay: float,
+    ):
+        self.name = name
+        self.path_prefixes = tuple(path_prefixes)
+        self.max_concurrency = max_concurrency
+        self.target_queue_delay = target_queue_delay
+        self.max_queue_delay = max_queue_delay
+        self.in_flight = 0
+        self._waiters: deque[tuple[float, asyncio.Future[None]]] = deque()
+        self._in_flight_gauge = in_flight_requests.labels(name)
+        self._queued_gauge = queued_requests.labels(name)
+        self._queue_delay = queue_delay.labels(name)
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.path_prefixes)
+
+    async def acquire(self) -> str | None:
+        """
+        Wait for a free slot. Returns None when admitted, otherwise the reason of rejection.
+        """
+        if not self.max_concurrency or (self.in_flight < self.max_concurrency and not self._waiters):
+            self._admit(0.0)
+            return None
+
+        now = time.perf_counter()
+        self._drop_abandoned()
+        if self._waiters and now - self._waiters[0][0] > self.target_queue_delay:
+            return "queue_delay"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((now, waiter))
+        self._queued_gauge.inc()
+        try:
+            async with asyncio.timeout(self.max_queue_delay):
+                await waiter
+        except TimeoutError:
+            if not waiter.done() or waiter.cancelled():
+                return "queue_timeout"
+            # The slot was handed over at the same time as the timeout
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # handed over to a client that has gone
+            raise
+        finally:
+            self._queued_gauge.dec()
+        self._queue_delay.observe(time.perf_counter() - now)
+        return None
+
+    def release(self) -> None:
+        self._drop_abandoned()
+        if self._waiters:
+            # Hand the slot over to the oldest waiting request, in_flight stays the same
+            _, waiter = self._waiters.popleft()
+            waiter.set_result(None)
+            return
+        self.in_flight -= 1
+        self._in_flight_gauge.dec()
+
+    def _admit(self, delay: float) -> None:
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+        self._queue_delay.observe(delay)
+
+    def _drop_abandoned(self) -> None:
+        # Waiters that timed out or were cancelled
+        while self._waiters and self._waiters[0][1].done():
+            self._waiters.popleft()
+
+
+class AdmissionMiddleware:
+    """
+    Admits HTTP requests through the first group that matches their path, or the `default` group.
+    Requests to `priority_paths` (e.g. metrics and health checks) bypass the limits, so they work under overload.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        default: AdmissionGroup,
+        groups: list[AdmissionGroup],
+        priority_paths: list[str],
+        retry_after: int,
+    ):
+        self.app = app
+        self.default = default
+        self.groups = groups
+        self.priority_paths = set(priority_paths)
+        self.retry_after = str(retry_after).encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"].removeprefix(scope.get("root_path", ""))
+        if path in self.priority_paths:
+            await self.app(scope, receive, send)
+            return
+
+        group = next((group for group in self.groups if group.matches(path)), self.default)
+        reason = await group.acquire()
+        if reason is not None:
+            shed_requests.labels(group.name, reason).inc()
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            group.release()
+
+    async def _reject(self, send: Send) -> None:
+        body = b"Service is overloaded, retry later"
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", self.retry_after),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
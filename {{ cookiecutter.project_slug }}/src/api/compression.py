@@ -0,0 +1,182 @@
+"""
+Response compression with zstd, brotli or gzip, negotiated from the `Accept-Encoding` request header.
+"""
+
+__all__ = ["ENCODERS", "CompressionMiddleware", "negotiate_encoding"]
+
+import asyncio
+import zlib
+from collections.abc import Callable
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from compression import zstd
+except ImportError:  # Python < 3.14
+    zstd = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+THREAD_THRESHOLD = 256 * 1024
+"Chunks at least this large (in bytes) are compressed in a thread, so that the event loop is not blocked"
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript", "application/xml")
+
+
+class Encoder(Protocol):
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        Compress the next chunk. Not final chunks are flushed, so that the client can decode everything sent so far.
+        """
+        ...
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # with the gzip header
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstd.ZstdCompressor(level=level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        mode = zstd.ZstdCompressor.FLUSH_FRAME if final else zstd.ZstdCompressor.FLUSH_BLOCK
+        return self._compressor.compress(data, mode=mode)
+
+
+ENCODERS: dict[str, Callable[[int], Encoder]] = {"gzip": GzipEncoder}
+"Available encoders by `Content-Encoding` name, created with a compression level"
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstd is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """
+    The first of `encodings` (in order of our preference) accepted by the client with a non-zero quality.
+    """
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _is_compressible(message: Message) -> bool:
+    status = message["status"]
+    if status < 200 or status in (204, 304):
+        return False
+    headers = Headers(raw=message.get("headers", []))
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.split(";")[0].endswith(("+json", "+xml"))
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of compressible types (JSON, NDJSON, text) larger than `minimum_size` bytes.
+    Streaming responses are compressed chunk by chunk as they are sent, without buffering the whole body.
+    """
+
+    def __init__(self, app: ASGIApp, encodings: list[str], minimum_size: int, levels: dict[str, int]):
+        self.app = app
+        self.encodings = [encoding for encoding in encodings if encoding in ENCODERS]
+        self.minimum_size = minimum_size
+        self.levels = levels
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoding, self.levels[encoding], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self._start: Message | None = None
+        self._encoder: Encoder | None = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self._start = message
+            self._passthrough = not _is_compressible(message)
+            content_length = Headers(raw=message.get("headers", [])).get("content-length")
+            if content_length is not None and int(content_length) < self.minimum_size:
+                self._passthrough = True
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough or self._start is None:
+            await self._send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+        if self._encoder is None:
+            if not more_body and len(body) < self.minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._encoder = ENCODERS[self.encoding](self.level)
+            compressed = await self._compress(body, final=not more_body)
+            self._start["headers"] = list(self._start.get("headers", []))
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("accept-encoding")
+            if more_body:
+                del headers["content-length"]
+            else:
+                headers["content-length"] = str(len(compressed))
+            await self._send(self._start)
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            return
+
+        compressed = await self._compress(body, final=not more_body)
+        await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+    async def _compress(self, data: bytes, final: bool) -> bytes:
+        assert self._encoder is not None
+        if len(data) >= THREAD_THRESHOLD:
+            return await asyncio.to_thread(self._encoder.compress, data, final)
+        return self._encoder.compress(data, final)
@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for production: `python -m src.api --production`.
+"""
+
+import gc
+import math
+import os
+from pathlib import Path
+
+from src.config import settings
+
+
+def cpu_limit() -> int:
+    """
+    Number of CPUs available to the process: the cgroup CPU quota of the container if set, otherwise the CPU count.
+    """
+    cpus = os.process_cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            quota = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text().strip()
+            period = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text().strip()
+        except OSError:
+            return cpus
+    if quota in ("max", "-1"):
+        return cpus
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = settings.server.workers or cpu_limit()
+preload_app = settings.server.preload
+max_requests = settings.server.max_requests
+max_requests_jitter = settings.server.max_requests_jitter
+timeout = settings.server.timeout
+graceful_timeout = 30
+forwarded_allow_ips = "*"
+
+
+def when_ready(server) -> None:
+    if preload_app and settings.server.gc_freeze:
+        # Objects of the preloaded app are never collected, and GC passes in workers would write to their headers
+        gc.collect()
+        gc.freeze()
+    server.log.info(f"Starting {workers} workers")
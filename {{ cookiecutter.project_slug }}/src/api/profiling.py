@@ -0,0 +1,252 @@
+"""
+Profiling of individual requests, on demand or for a sample of requests.
+
+The profile covers everything the request goes through: middlewares, dependencies, the handler and serialization.
+Profilers observe the whole event loop thread, so coroutines of concurrent requests that ran meanwhile are included too.
+"""
+
+__all__ = ["ProfilerMiddleware"]
+
+import asyncio
+import cProfile
+import hmac
+import itertools
+import json
+import marshal
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Literal
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.logging_ import logger
+
+type ProfileFormat = Literal["pstats", "speedscope"]
+
+TOKEN_HEADER = "x-profile-token"
+OUTPUT_HEADER = "x-profile-output"
+OUTPUT_QUERY = "profile_output"
+
+
+class StackSampler:
+    """
+    Samples the call stack of a thread from a background thread, for a flame graph in speedscope.
+
+    The sampler needs the GIL for every sample, so CPU-bound code is sampled about once per switch interval (5 ms):
+    requests faster than that may get no samples, profile them in the pstats format.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self._frames: dict[tuple[str, str, int], int] = {}
+        self._samples: list[list[int]] = []
+        self._weights: list[float] = []
+        self._started_at = 0.0
+        self._duration = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self._samples.append(self._stack(frame))
+                self._weights.append(now - last)
+            last = now
+
+    def _stack(self, frame: FrameType | None) -> list[int]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_qualname, code.co_filename, code.co_firstlineno)
+            index = self._frames.get(key)
+            if index is None:
+                index = self._frames[key] = len(self._frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()  # root first
+        return stack
+
+    def speedscope(self, name: str) -> dict:
+        """Profile in the speedscope file format: https://www.speedscope.app/file-format-schema.json"""
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {
+                "frames": [{"name": qualname, "file": file, "line": line} for qualname, file, line in self._frames],
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self._duration,
+                    "samples": self._samples,
+                    "weights": self._weights,
+                }
+            ],
+            "name": name,
+            "exporter": "src.api.profiling",
+        }
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a request if it carries the token in the `X-Profile-Token` header, and every `sample_rate`-th request.
+    The token is not accepted in the query string: it would be written to access logs.
+    Only one request is profiled at a time, others are handled without profiling.
+
+    Profiles are saved to `directory`, the file name is sent in the `X-Profile-File` header.
+    Only the latest `max_files` profiles are kept, older ones are deleted.
+    With `X-Profile-Output: response` (or `profile_output=response`), the profile is sent instead of the response.
+
+    Formats: "pstats" is a cProfile dump (`python -m pstats`, snakeviz) with exact call counts,
+    "speedscope" is a flame graph of stack samples (https://www.speedscope.app).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        token: str | None,
+        directory: Path,
+        format: ProfileFormat = "speedscope",
+        sample_rate: int = 0,
+        max_files: int = 100,
+    ):
+        self.app = app
+        self.token = token
+        self.directory = directory
+        self.format = format
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._counter = itertools.count(1)
+        self._active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+        on_demand = self._is_authorized(scope)
+        if not on_demand and not (self.sample_rate and next(self._counter) % self.sample_rate == 0):
+            await self.app(scope, receive, send)
+            return
+        profiler = self._start_profiler()
+        if profiler is None:  # another profiler (e.g. a debugger) is active
+            await self.app(scope, receive, send)
+            return
+        if on_demand and self._requested_output(scope) == "response":
+            await self._profile_to_response(profiler, scope, receive, send)
+        else:
+            await self._profile_to_file(profiler, scope, receive, send, announce=on_demand)
+
+    def _is_authorized(self, scope: Scope) -> bool:
+        if not self.token:
+            return False
+        token = Headers(scope=scope).get(TOKEN_HEADER)
+        return token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _requested_output(self, scope: Scope) -> str | None:
+        output = Headers(scope=scope).get(OUTPUT_HEADER)
+        if output is None and OUTPUT_QUERY.encode() in scope["query_string"]:
+            output = parse_qs(scope["query_string"].decode()).get(OUTPUT_QUERY, [None])[0]
+        return output
+
+    async def _profile_to_file(
+        self, profiler: cProfile.Profile | StackSampler, scope: Scope, receive: Receive, send: Send, announce: bool
+    ) -> None:
+        name = self._profile_name(scope)
+        path = self.directory / f"{name}.{'prof' if self.format == 'pstats' else 'speedscope.json'}"
+
+        async def send_with_header(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-file", path.name.encode())]
+            await send(message)
+
+        profile = await self._run_profiled(profiler, name, scope, receive, send_with_header if announce else send)
+        await asyncio.to_thread(self._save, path, profile)
+
+    async def _profile_to_response(
+        self, profiler: cProfile.Profile | StackSampler, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        async def discard(message: Message) -> None:
+            pass
+
+        profile = await self._run_profiled(profiler, self._profile_name(scope), scope, receive, discard)
+        media_type = b"application/octet-stream" if self.format == "pstats" else b"application/json"
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", media_type), (b"content-length", str(len(profile)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": profile})
+
+    def _start_profiler(self) -> cProfile.Profile | StackSampler | None:
+        """
+        Start profiling the event loop thread, before the request is passed on. None if the profiler is unavailable.
+        """
+        if self.format == "pstats":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler (e.g. a debugger) is active
+                return None
+        else:
+            profiler = StackSampler(threading.get_ident())
+            profiler.start()
+        self._active = True
+        return profiler
+
+    async def _run_profiled(
+        self, profiler: cProfile.Profile | StackSampler, name: str, scope: Scope, receive: Receive, send: Send
+    ) -> bytes:
+        """
+        Run the request under the started profiler and return the serialized profile.
+        """
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            else:
+                profiler.stop()
+            self._active = False
+        if isinstance(profiler, cProfile.Profile):
+            profiler.create_stats()
+            return marshal.dumps(profiler.stats)  # the format of `Profile.dump_stats`
+        return json.dumps(profiler.speedscope(name)).encode()
+
+    def _profile_name(self, scope: Scope) -> str:
+        path = re.sub(r"[^\w.-]+", "_", scope["path"]).strip("_") or "root"
+        return f"{datetime.now():%Y%m%d-%H%M%S-%f}_{scope['method']}_{path}"
+
+    def _save(self, path: Path, profile: bytes) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(profile)
+            # Names start with the time, so the oldest profiles come first
+            profiles = sorted(p for pattern in ("*.prof", "*.speedscope.json") for p in self.directory.glob(pattern))
+            for old in profiles[: -self.max_files]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not save profile to {path}: {e}")
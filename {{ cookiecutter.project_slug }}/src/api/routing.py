@@ -0,0 +1,129 @@
+__all__ = ["FastResponseAPIRoute", "body_etag", "etag_matches"]
+
+import hashlib
+import inspect
+from collections.abc import Callable, Coroutine
+from typing import Any, get_args, get_origin
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.utils import is_body_allowed_for_status_code
+from fastapi_derive_responses import AutoDeriveResponsesAPIRoute
+from pydantic import BaseModel, TypeAdapter
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src import tracing
+from src.logging_ import endpoint_response_hooks, endpoint_status_codes
+
+
+def _sets_response(dependant: Dependant) -> bool:
+    # Headers and status code set on a `response: Response` parameter only apply to responses built by FastAPI
+    return dependant.response_param_name is not None or any(_sets_response(d) for d in dependant.dependencies)
+
+
+def body_etag(body: bytes) -> str:
+    """
+    Weak ETag from a hash of the body: weak, so it stays valid when the body is compressed.
+    """
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Weak comparison of the ETag with the `If-None-Match` header value (a list of ETags or "*").
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+
+def not_modified(response: Response) -> Response:
+    """
+    304 response for a client that already has the response: headers without the body.
+    """
+    result = Response(status_code=304, background=response.background)
+    result.raw_headers = [
+        (name, value) for name, value in response.raw_headers if name not in (b"content-length", b"content-type")
+    ]
+    return result
+
+
+class FastResponseAPIRoute(AutoDeriveResponsesAPIRoute):
+    """
+    Route class that skips revalidation of responses which are already instances of the response model
+    (or a list of them), e.g. a `ViewUser` read with a projection. Such responses are serialized straight
+    to JSON bytes by pydantic-core and returned as a ready `Response`, other values are validated as usual.
+
+    GET responses get an ETag, and a request with a matching `If-None-Match` gets an empty 304 response.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        if self.status_code is not None:
+            endpoint_status_codes[self.endpoint] = self.status_code
+        if tracing.enabled:
+            tracing.trace_dependencies(self.dependant)
+        hook = self._trusted_response_hook()
+        if hook is not None:
+            endpoint_response_hooks[self.endpoint] = hook
+        handler = super().get_route_handler()
+        if "GET" not in self.methods:
+            return handler
+
+        async def conditional_get_handler(request: Request) -> Response:
+            response = await handler(request)
+            # Streaming responses have no body to hash
+            body = getattr(response, "body", None)
+            if response.status_code != 200 or not isinstance(body, bytes):
+                return response
+            etag = response.headers.get("etag")
+            if etag is None:
+                etag = response.headers["etag"] = body_etag(body)
+            if_none_match = request.headers.get("if-none-match")
+            if if_none_match is not None and etag_matches(if_none_match, etag):
+                return not_modified(response)
+            return response
+
+        return conditional_get_handler
+
+    def _trusted_response_hook(self) -> Callable[[Any], Any] | None:
+        """
+        Return value hook that serializes instances of the response model without validating them again.
+        None if FastAPI has to build the response itself: custom response class or status code without a body,
+        or a `response: Response` parameter.
+        """
+        model: Any = self.response_model
+        many = get_origin(model) is list
+        if many:
+            (model,) = get_args(model) or (Any,)
+        if not (inspect.isclass(model) and issubclass(model, BaseModel)):
+            return None
+        if not isinstance(self.response_class, DefaultPlaceholder) or _sets_response(self.dependant):
+            return None
+        status_code = self.status_code or 200
+        if not is_body_allowed_for_status_code(status_code):
+            return None
+
+        adapter = TypeAdapter(self.response_model)
+        dump_options: dict[str, Any] = {
+            "include": self.response_model_include,
+            "exclude": self.response_model_exclude,
+            "by_alias": self.response_model_by_alias,
+            "exclude_unset": self.response_model_exclude_unset,
+            "exclude_defaults": self.response_model_exclude_defaults,
+            "exclude_none": self.response_model_exclude_none,
+        }
+
+        def respond_as_is(value: Any) -> Any:
+            if many:
+                trusted = isinstance(value, list) and all(isinstance(item, model) for item in value)
+            else:
+                trusted = isinstance(value, model)
+            if not trusted:
+                return value
+            with tracing.span("response.serialize"):
+                body = adapter.dump_json(value, **dump_options)
+            return Response(body, status_code=status_code, media_type="application/json")
+
+        return respond_as_is
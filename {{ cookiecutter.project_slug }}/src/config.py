@@ -1,7 +1,9 @@
 import os
 from pathlib import Path
 
+from src import startup
 from src.config_schema import Settings
 
 settings_path = os.getenv("SETTINGS_PATH", "settings.yaml")
-settings: Settings = Settings.from_yaml(Path(settings_path))
+with startup.phase("settings"):
+    settings: Settings = Settings.from_yaml(Path(settings_path))
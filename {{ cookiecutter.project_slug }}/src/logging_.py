@@ -2,17 +2,32 @@
 Based on https://github.com/dantetemplar/fastapi-how-to-log
 """
 
-__all__ = ["logger"]
+__all__ = ["LogSampler", "client_error_sampler", "logger"]
 
 import asyncio
+import atexit
+import datetime
+import functools
 import inspect
+import json
 import logging.config
 import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Hashable
 from typing import Any
 
 import fastapi
 from fastapi.dependencies.models import Dependant
 from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+
+from src import tracing
+from src.config import settings
+from src.config_schema import LogFormat
+from src.metrics import metrics
 
 
 class RelativePathFilter(logging.Filter):
@@ -55,6 +70,231 @@ class CleanErrorFilter(logging.Filter):
         return True
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    Compact single-line JSON for log collectors.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        relative_path = getattr(record, "relativePath", None)
+        if relative_path:
+            data["source"] = f"{relative_path}:{record.lineno}"
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """
+    Stream handler that keeps formatted records in memory and writes them with a single call on `flush()`.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self._pending: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._pending.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._pending:
+                self.stream.write("".join(self._pending))
+                self._pending.clear()
+            super().flush()
+
+
+class BackgroundWriter:
+    """
+    Thread that passes queued records to their target handlers.
+    Records that arrived together are written in one batch: one `flush()` per handler.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int):
+        self.queue: queue.Queue[tuple[logging.Handler, logging.LogRecord] | None] = queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._thread: threading.Thread | None = None
+
+    def put(self, handler: logging.Handler, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait((handler, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def restart_after_fork(self) -> None:
+        """
+        Threads do not survive `fork()` (e.g. gunicorn workers of a preloaded app): start a new one in the child.
+        The queue is replaced, its lock could be held by the parent's thread at the moment of the fork.
+        """
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        if self._thread is not None:
+            self.start()
+
+    def stop(self) -> None:
+        """
+        Write the remaining records and stop the thread.
+        """
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            handlers: set[logging.Handler] = set()
+            stopped = False
+            for item in batch:
+                if item is None:
+                    stopped = True
+                    continue
+                handler, record = item
+                handler.handle(record)
+                handlers.add(handler)
+            for handler in handlers:
+                handler.flush()
+
+            if stopped:
+                return
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                logging.getLogger("src").warning(f"Dropped {dropped} log records, because the log queue was full")
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Hands records over to the background writer.
+    Filters and formatting of the target handler are applied in the writer thread, off the event loop,
+    except for tracebacks: they are formatted before the emitting code moves on.
+    """
+
+    def __init__(self, target: logging.Handler, writer: BackgroundWriter):
+        super().__init__(target.level)
+        self.target = target
+        self.writer = writer
+
+    def handle(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and the traceback now: arguments and the frames of the traceback
+        # may change before the writer thread gets to the record
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = (self.target.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        self.writer.put(self.target, record)
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.handle(record)
+
+
+class LogSampler:
+    """
+    Limits repetitive log records, e.g. errors caused by a misbehaving client.
+
+    Records are grouped by a fingerprint: the first `burst` records of a fingerprint in an interval are logged,
+    after that only every `sample_rate`-th one (none if 0). The number of suppressed records is reported
+    for every fingerprint when its interval is over (by a timer of the event loop), and by `flush()` at exit.
+    Check `should_log` before building the record, so that suppressed records cost nothing.
+    """
+
+    def __init__(self, burst: int, interval: float, sample_rate: int = 0, max_fingerprints: int = 10_000):
+        self.burst = burst
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_fingerprints = max_fingerprints
+        # fingerprint -> [interval start, records, suppressed records]
+        self._windows: dict[Hashable, list] = {}
+        self._swept_at = time.monotonic()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def should_log(self, fingerprint: Hashable) -> bool:
+        now = time.monotonic()
+        if now - self._swept_at >= self.interval:
+            self._sweep(now)
+        window = self._windows.get(fingerprint)
+        if window is None:
+            if len(self._windows) >= self.max_fingerprints:
+                oldest = next(iter(self._windows))
+                self._report(oldest, self._windows.pop(oldest), now)
+            window = self._windows[fingerprint] = [now, 0, 0]
+        window[1] += 1
+        over_burst = window[1] - self.burst
+        if over_burst <= 0 or (self.sample_rate and over_burst % self.sample_rate == 0):
+            return True
+        window[2] += 1
+        if self._timer is None:
+            self._schedule_sweep(window[0] + self.interval - now)
+        return False
+
+    def flush(self) -> None:
+        """
+        Report the suppressed records of all fingerprints, e.g. at exit.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        windows, self._windows = self._windows, {}
+        for fingerprint, window in windows.items():
+            self._report(fingerprint, window, now)
+
+    def _schedule_sweep(self, delay: float) -> None:
+        # Without a timer, the suppressed records of the last interval would be reported on the next record only
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(max(delay, 0), self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        now = time.monotonic()
+        self._sweep(now)
+        pending = [window[0] for window in self._windows.values() if window[2]]
+        if pending:
+            self._schedule_sweep(min(pending) + self.interval - now)
+
+    def _sweep(self, now: float) -> None:
+        self._swept_at = now
+        for fingerprint, window in list(self._windows.items()):
+            if now - window[0] >= self.interval:
+                del self._windows[fingerprint]
+                self._report(fingerprint, window, now)
+
+    def _report(self, fingerprint: Hashable, window: list, now: float) -> None:
+        started_at, _, suppressed = window
+        if suppressed:
+            duration = now - started_at
+            logger.warning(f"Suppressed {suppressed} similar log records in the last {duration:.0f} s: {fingerprint}")
+
+
 dictConfig = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -83,15 +323,72 @@ dictConfig = {
     },
 }
 
+if settings.logging.format == LogFormat.JSON:
+    dictConfig["formatters"] = {"default": {"()": JsonFormatter}, "src": {"()": JsonFormatter}}
+if settings.logging.background:
+    for handler_config in dictConfig["handlers"].values():
+        del handler_config["class"]
+        handler_config["()"] = BatchStreamHandler
+
 logging.config.dictConfig(dictConfig)
 
 logger = logging.getLogger("src")
-logger.addFilter(RelativePathFilter())
 logger.addFilter(CleanErrorFilter())
 
 exc_logger = logging.getLogger("uvicorn.error")
 exc_logger.addFilter(CleanErrorFilter())
 
+if settings.logging.background:
+    # Loggers only enqueue records, handler filters run in the writer thread
+    logging.getHandlerByName("src").addFilter(RelativePathFilter())
+
+    log_writer = BackgroundWriter(settings.logging.queue_size, settings.logging.batch_size)
+    for logger_name in dictConfig["loggers"]:
+        configured_logger = logging.getLogger(logger_name)
+        configured_logger.handlers = [BackgroundHandler(h, log_writer) for h in configured_logger.handlers]
+    log_writer.start()
+    atexit.register(log_writer.stop)
+    os.register_at_fork(after_in_child=log_writer.restart_after_fork)
+else:
+    logger.addFilter(RelativePathFilter())
+
+
+client_error_sampler = LogSampler(
+    settings.logging.client_errors_burst,
+    settings.logging.client_errors_interval,
+    settings.logging.client_errors_sample_rate,
+)
+"Sampler for logs of errors caused by clients (validation errors, HTTP exceptions)"
+atexit.register(client_error_sampler.flush)  # before the background writer is stopped
+
+
+handler_duration = metrics.histogram(
+    "http_handler_duration_seconds",
+    "Duration of endpoint functions (without dependencies and serialization)",
+    ("route", "status"),
+)
+
+endpoint_status_codes: dict[Callable[..., Any], int] = {}
+"Status codes of routes (e.g. `status_code=201`) by endpoint function, for plain return values of the endpoints"
+
+endpoint_response_hooks: dict[Callable[..., Any], Callable[[Any], Any]] = {}
+"Functions applied to return values of endpoints by endpoint function, e.g. to build the response without validation"
+
+
+@functools.cache
+def _source_location(call: Callable[..., Any]) -> tuple[str, str, str, int]:
+    """
+    Name, path, relative path and line number of the endpoint function.
+    Cached, because `inspect` reads source files from disk.
+    """
+    func_name = getattr(call, "__name__", type(call).__name__)
+    try:
+        pathname = inspect.getsourcefile(call) or "unknown"
+        lineno = inspect.getsourcelines(call)[1]
+    except (OSError, TypeError):
+        pathname, lineno = "unknown", 0
+    return func_name, pathname, os.path.relpath(pathname), lineno
+
 
 async def run_endpoint_function(*, dependant: Dependant, values: dict[str, Any], is_coroutine: bool) -> Any:
     # Only called by get_request_handler. Has been split into its own function to
@@ -99,29 +396,46 @@ async def run_endpoint_function(*, dependant: Dependant, values: dict[str, Any],
     assert dependant.call is not None, "dependant.call must be a function"
     loop = asyncio.get_running_loop()
     start_time = loop.time()
-    if is_coroutine:
-        r = await dependant.call(**values)
-    else:
-        r = await run_in_threadpool(dependant.call, **values)
-    finish_time = loop.time()
-    duration = finish_time - start_time
-    callback = dependant.call
-    func_name = callback.__name__
-    pathname = inspect.getsourcefile(callback) or "unknown"
-    lineno = inspect.getsourcelines(callback)[1]
-    record = logging.LogRecord(
-        name="src.fastapi.run_endpoint_function",
-        level=logging.INFO,
-        pathname=pathname,
-        lineno=lineno,
-        msg=f"Handler `{func_name}` took {int(duration * 1000)} ms",
-        args=(),
-        exc_info=None,
-        func=func_name,
-    )
-    record.relativePath = os.path.relpath(record.pathname)
-    logger.handle(record)
-    return r
+    # Status is taken from the returned Response or the raised exception, or the status code of the route
+    status: int | None = endpoint_status_codes.get(dependant.call, 200)
+    try:
+        with tracing.span("handler"):
+            if is_coroutine:
+                r = await dependant.call(**values)
+            else:
+                r = await run_in_threadpool(dependant.call, **values)
+        hook = endpoint_response_hooks.get(dependant.call)
+        if hook is not None:
+            r = hook(r)
+        if isinstance(r, Response):
+            status = r.status_code
+        return r
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except asyncio.CancelledError:
+        status = None  # the client has disconnected or the server is shutting down, not an error
+        raise
+    except BaseException:
+        status = 500
+        raise
+    finally:
+        duration = loop.time() - start_time
+        if status is not None:
+            handler_duration.labels(dependant.path or "unknown", str(status)).observe(duration)
+        func_name, pathname, relative_path, lineno = _source_location(dependant.call)
+        record = logging.LogRecord(
+            name="src.fastapi.run_endpoint_function",
+            level=logging.INFO,
+            pathname=pathname,
+            lineno=lineno,
+            msg=f"Handler `{func_name}` took {int(duration * 1000)} ms",
+            args=(),
+            exc_info=None,
+            func=func_name,
+        )
+        record.relativePath = relative_path
+        logger.handle(record)
 
 
 # monkey patch fastapi to log endpoint function duration and link to source code
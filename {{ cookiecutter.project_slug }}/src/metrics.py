@@ -0,0 +1,172 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Metrics live in the memory of the worker process, so each worker reports its own values.
+Observe only from the event loop thread: metrics are not guarded by locks.
+"""
+
+__all__ = ["DEFAULT_BUCKETS", "Histogram", "HistogramFamily", "MetricsRegistry", "Value", "ValueFamily", "metrics"]
+
+import bisect
+from collections.abc import Iterator
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+"Upper bounds of histogram buckets (in seconds), same as the defaults of the official Prometheus clients"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_float(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """Cumulative histogram of observed values"""
+
+    __slots__ = ("buckets", "count", "counts", "sum")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    """Histograms with the same name, split by label values"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._children: dict[tuple[str, ...], Histogram] = {}
+
+    def labels(self, *values: str) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"Expected labels {self.label_names}, got {values}")
+            child = self._children[values] = Histogram(self.buckets)
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for values, histogram in sorted(self._children.items()):
+            cumulative = 0
+            for upper_bound, count in zip((*histogram.buckets, float("inf")), histogram.counts, strict=True):
+                cumulative += count
+                labels = _format_labels(self.label_names, values, f'le="{_format_float(upper_bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, values)
+            yield f"{self.name}_sum{labels} {_format_float(histogram.sum)}"
+            yield f"{self.name}_count{labels} {histogram.count}"
+
+
+class Value:
+    """Current value of a counter or a gauge"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class ValueFamily:
+    """Counters or gauges with the same name, split by label values"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...], type_: str):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.type = type_
+        self._children: dict[tuple[str, ...], Value] = {}
+
+    def labels(self, *values: str) -> Value:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"Expected labels {self.label_names}, got {values}")
+            child = self._children[values] = Value()
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for values, child in sorted(self._children.items()):
+            yield f"{self.name}{_format_labels(self.label_names, values)} {_format_float(child.value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: dict[str, HistogramFamily | ValueFamily] = {}
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> HistogramFamily:
+        """
+        Get or register a histogram family.
+        """
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = HistogramFamily(name, documentation, label_names, buckets)
+        assert isinstance(family, HistogramFamily), f"{name} is already registered with another type"
+        return family
+
+    def counter(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> ValueFamily:
+        """
+        Get or register a counter family: a value that only increases, e.g. a number of events.
+        """
+        return self._value_family(name, documentation, label_names, "counter")
+
+    def gauge(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> ValueFamily:
+        """
+        Get or register a gauge family: a value that goes up and down, e.g. a number of requests in progress.
+        """
+        return self._value_family(name, documentation, label_names, "gauge")
+
+    def _value_family(self, name: str, documentation: str, label_names: tuple[str, ...], type_: str) -> ValueFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = ValueFamily(name, documentation, label_names, type_)
+        assert isinstance(family, ValueFamily), f"{name} is already registered with another type"
+        assert family.type == type_, f"{name} is already registered with another type"
+        return family
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = [line for family in self._families.values() for line in family.render()]
+        return "\n".join(lines) + "\n"
+
+
+metrics: MetricsRegistry = MetricsRegistry()
@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.api.routing import FastResponseAPIRoute
+from src.metrics import metrics
+
+router = APIRouter(
+    tags=["Metrics"],
+    route_class=FastResponseAPIRoute,
+)
+
+
+@router.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """
+    Metrics of this worker process in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/health", include_in_schema=False, response_class=PlainTextResponse)
+async def get_health() -> PlainTextResponse:
+    """
+    Liveness check: the worker handles requests. Bypasses admission control, so it answers under overload too
+    """
+    return PlainTextResponse("OK")
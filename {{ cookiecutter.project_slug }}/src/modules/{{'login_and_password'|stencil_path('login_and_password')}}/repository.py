@@ -1,19 +1,68 @@
 __all__ = ["LoginPasswordRepository", "login_password_repository"]
 
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+from src.config import settings
 from src.modules.user.schemas import UserAuthData
 from src.modules.user.repository import user_repository
 
-import bcrypt
+
+def _truncate(password: str) -> bytes:
+    # Bcrypt has a maximum password length of 72 bytes
+    return password.encode('utf-8')[:72]
+
+
+def _hash_password(password_bytes: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password_bytes: bytes, password_hash: str) -> bool:
+    return bcrypt.checkpw(password_bytes, password_hash.encode('utf-8'))
+
+
+def _get_rounds(password_hash: str) -> int | None:
+    # Bcrypt hash looks like "$2b$12$<salt and hash>", where 12 is the cost
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
 
 
 class LoginPasswordRepository:
-    @classmethod
-    def get_password_hash(cls, password: str) -> str:
-        # Bcrypt has a maximum password length of 72 bytes
-        password_bytes = password.encode('utf-8')[:72]
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password_bytes, salt)
-        return hashed.decode('utf-8')
+    """
+    Bcrypt takes 100+ ms of CPU per call, so hashing runs in a worker pool instead of the event loop.
+    """
+
+    def __init__(self, rounds: int, executor: str, workers: int, max_pending: int):
+        self.rounds = rounds
+        self.executor_kind = executor
+        self.workers = workers
+        self._pending = asyncio.Semaphore(max_pending)
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run_in_pool[T](self, func: Callable[..., T], *args) -> T:
+        async with self._pending:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def get_password_hash(self, password: str) -> str:
+        return await self._run_in_pool(_hash_password, _truncate(password), self.rounds)
 
     async def verify_credentials(self, login: str, password: str) -> UserAuthData | None:
         user = await user_repository.read_id_and_password_hash(login)
@@ -22,13 +71,21 @@ class LoginPasswordRepository:
             return None
         user_id, password_hash = user
 
-        # Apply same truncation for verification
-        password_bytes = password.encode('utf-8')[:72]
-        password_verified = bcrypt.checkpw(password_bytes, password_hash.encode('utf-8'))
+        password_verified = await self._run_in_pool(_check_password, _truncate(password), password_hash)
         if not password_verified:
             return None
 
+        # Transparently upgrade (or downgrade) the hash when the configured cost has changed
+        if _get_rounds(password_hash) != self.rounds:
+            new_password_hash = await self.get_password_hash(password)
+            await user_repository.update_password_hash(user_id, new_password_hash)
+
         return UserAuthData(user_id=user_id)
 
 
-login_password_repository: LoginPasswordRepository = LoginPasswordRepository()
+login_password_repository: LoginPasswordRepository = LoginPasswordRepository(
+    rounds=settings.password_hashing.rounds,
+    executor=settings.password_hashing.executor,
+    workers=settings.password_hashing.workers,
+    max_pending=settings.password_hashing.max_pending,
+)
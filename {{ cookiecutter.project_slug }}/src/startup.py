@@ -0,0 +1,51 @@
+"""
+Startup timing breakdown: how long the worker spent on imports, settings, database connection, etc.
+"""
+
+__all__ = ["finish_imports", "phase", "summary"]
+
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    def reset(self) -> None:
+        self.started_at = time.perf_counter()
+        self.phases.clear()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure a startup phase.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started_at
+
+    def finish_imports(self) -> None:
+        """
+        Record the time spent on imports since the timer was started, excluding the phases measured so far.
+        """
+        self.phases["imports"] = time.perf_counter() - self.started_at - sum(self.phases.values())
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.started_at
+        breakdown = ", ".join(f"{name} {duration * 1000:.0f} ms" for name, duration in self.phases.items())
+        return f"Started in {total * 1000:.0f} ms" + (f": {breakdown}" if breakdown else "")
+
+
+_timer = StartupTimer()  # started on the first import of the `src` package
+# A worker forked from a preloaded master starts with the app already imported
+os.register_at_fork(after_in_child=_timer.reset)
+
+phase = _timer.phase
+finish_imports = _timer.finish_imports
+summary = _timer.summary
@@ -1,9 +1,10 @@
 __all__ = ["CustomDocument"]
 
-from typing import Annotated
+import functools
+from typing import Annotated, Any
 
 from beanie import Document, PydanticObjectId
-from pydantic import ConfigDict, Field, GetJsonSchemaHandler, WithJsonSchema
+from pydantic import BaseModel, ConfigDict, Field, GetJsonSchemaHandler, WithJsonSchema
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import CoreSchema
 
@@ -21,6 +22,22 @@ MongoDbId = Annotated[
 ]
 
 
+@functools.cache
+def _projection_model[T: BaseModel](schema: type[T]) -> type[T]:
+    projection: dict[str, Any] = {"_id": 0}
+    for name, field in schema.model_fields.items():
+        key = field.alias or name
+        projection[key] = "$_id" if key == "id" else 1
+    namespace = {"__module__": schema.__module__, "__qualname__": schema.__qualname__}
+    # Nested class, like `class Settings` in a class body, so that pydantic does not treat it as a field
+    namespace["Settings"] = type(
+        "Settings",
+        (),
+        {"__module__": schema.__module__, "__qualname__": f"{schema.__qualname__}.Settings", "projection": projection},
+    )
+    return type(schema.__name__, (schema,), namespace)
+
+
 class CustomDocument(Document):
     model_config = ConfigDict(json_schema_serialization_defaults_required=True)
 
@@ -45,3 +62,11 @@ class CustomDocument(Document):
             if "required" not in schema:
                 schema["required"] = ["id"]
         return schema
+
+    @classmethod
+    def projection_of[T: BaseModel](cls, schema: type[T]) -> type[T]:
+        """
+        Subclass of `schema` to pass to Beanie's `project()`: only the schema fields are fetched and parsed,
+        `id` is filled from `_id`. Subclasses are cached, so it is cheap to call on every query.
+        """
+        return _projection_model(schema)
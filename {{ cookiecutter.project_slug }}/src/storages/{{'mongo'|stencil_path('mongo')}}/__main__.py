@@ -0,0 +1,36 @@
+"""
+Apply index and view changes of the document models: `python -m src.storages.mongo`.
+
+Run it once per deploy when workers start with `database.apply_schema_on_startup: false`.
+"""
+
+import asyncio
+import time
+
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from src.config import settings
+from src.logging_ import logger
+from src.storages.mongo import document_models
+
+
+async def main() -> None:
+    motor_client: AsyncIOMotorClient = AsyncIOMotorClient(
+        settings.database_uri.get_secret_value(),
+        connectTimeoutMS=5000,
+        serverSelectionTimeoutMS=5000,
+        tz_aware=True,
+    )
+    try:
+        started_at = time.perf_counter()
+        await init_beanie(database=motor_client.get_database(), document_models=document_models, recreate_views=True)
+        logger.info(
+            f"Applied indexes and views of {len(document_models)} models in {(time.perf_counter() - started_at) * 1000:.0f} ms"
+        )
+    finally:
+        motor_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,209 @@
+__all__ = ["CommandMetricsListener", "CommandStatsMiddleware", "PoolMetricsListener", "command_stats_scope"]
+
+import asyncio
+import json
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.logging_ import logger
+from src.metrics import metrics
+
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+checkout_duration = metrics.histogram(
+    "mongo_pool_checkout_seconds",
+    "Time spent waiting for a connection from the MongoDB pool",
+    ("outcome",),
+    CHECKOUT_BUCKETS,
+)
+command_duration = metrics.histogram(
+    "mongo_command_duration_seconds",
+    "Duration of MongoDB commands",
+    ("collection", "command", "outcome"),
+)
+commands_per_request = metrics.histogram(
+    "mongo_commands_per_request",
+    "Number of MongoDB commands sent while handling a request",
+    ("route",),
+    (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    Reports how long operations wait for a pooled connection.
+
+    The driver calls listeners from its own threads, so metrics are updated in the event loop thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, slow_checkout_threshold: float):
+        self.loop = loop
+        self.slow_checkout_threshold = slow_checkout_threshold
+
+    def _observe(self, outcome: str, duration: float | None) -> None:
+        if duration is None:
+            return
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(checkout_duration.labels(outcome).observe, duration)
+        if duration >= self.slow_checkout_threshold:
+            logger.warning(f"Waited {duration * 1000:.0f} ms for a MongoDB connection ({outcome})")
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        self._observe("ok", event.duration)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        self._observe(str(event.reason), event.duration)
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        logger.warning(f"MongoDB connection pool for {event.address} was cleared")
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        pass
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        pass
+
+
+type CommandKey = tuple[str, str, str]
+"Collection, command name and filter shape"
+
+_request_commands: ContextVar[Counter[CommandKey] | None] = ContextVar("request_commands", default=None)
+
+
+@contextmanager
+def command_stats_scope() -> Iterator[Counter[CommandKey]]:
+    """
+    Count MongoDB commands sent until the end of the scope (e.g. a request), by collection, command and filter shape.
+    """
+    counter: Counter[CommandKey] = Counter()
+    token = _request_commands.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_commands.reset(token)
+
+
+def filter_shape(value: Any) -> Any:
+    """
+    Filter with values replaced by "?": `{"_id": {"$in": [...]}}` -> `{"_id": {"$in": "?"}}`.
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [filter_shape(item) for item in value]  # e.g. $and, $or or an aggregation pipeline
+    return "?"
+
+
+def _command_filter(command_name: str, command: dict[str, Any]) -> Any:
+    match command_name:
+        case "find":
+            return command.get("filter")
+        case "aggregate":
+            return command.get("pipeline")
+        case "update":
+            return [update.get("q") for update in command.get("updates", [])[:1]]
+        case "delete":
+            return [delete.get("q") for delete in command.get("deletes", [])[:1]]
+        case "count" | "distinct" | "findAndModify":
+            return command.get("query")
+    return None
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Measures MongoDB commands by collection and command name, logs slow ones with the shape of their filter,
+    and counts commands of the current request for `CommandStatsMiddleware`.
+
+    Motor runs the driver in threads with a copy of the caller's context, so the request is known in listeners.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, slow_command_threshold: float):
+        self.loop = loop
+        self.slow_command_threshold = slow_command_threshold
+        # request id -> (collection, command name, filter shape)
+        self._started: dict[int, CommandKey] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        command_name = event.command_name
+        collection = event.command.get("collection" if command_name == "getMore" else command_name)
+        shape = json.dumps(filter_shape(_command_filter(command_name, event.command)))
+        key = (collection if isinstance(collection, str) else "", command_name, shape)
+        self._started[event.request_id] = key
+        counter = _request_commands.get()
+        if counter is not None and not self.loop.is_closed():
+            # Counted in the event loop thread, before the caller gets the result
+            self.loop.call_soon_threadsafe(counter.update, (key,))
+
+    def _finished(self, event: monitoring.CommandSucceededEvent | monitoring.CommandFailedEvent, outcome: str) -> None:
+        key = self._started.pop(event.request_id, None)
+        if key is None:
+            return
+        collection, command_name, shape = key
+        duration = event.duration_micros / 1_000_000
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(command_duration.labels(collection, command_name, outcome).observe, duration)
+        if duration >= self.slow_command_threshold:
+            logger.warning(
+                f"Slow MongoDB command `{command_name}` on `{collection}` took {duration * 1000:.0f} ms ({outcome}), "
+                f"filter: {shape}"
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, "error")
+
+
+class CommandStatsMiddleware:
+    """
+    Counts MongoDB commands of every HTTP request and warns about N+1 queries: more than `similar_commands_threshold`
+    commands with the same collection, command and filter shape (e.g. reading documents by id in a loop).
+    """
+
+    def __init__(self, app: ASGIApp, similar_commands_threshold: int):
+        self.app = app
+        self.similar_commands_threshold = similar_commands_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with command_stats_scope() as counter:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                route_path = getattr(scope.get("route"), "path", None)
+                commands_per_request.labels(route_path or "unknown").observe(counter.total())
+                for (collection, command_name, shape), count in counter.items():
+                    # Batches of a cursor are fetched one by one by design
+                    if count > self.similar_commands_threshold and command_name != "getMore":
+                        logger.warning(
+                            f"{scope['method']} {route_path or scope['path']} sent {count} similar MongoDB commands: "
+                            f"`{command_name}` on `{collection}` with filter {shape}, "
+                            "consider a single query for all of them (e.g. with `$in`)"
+                        )
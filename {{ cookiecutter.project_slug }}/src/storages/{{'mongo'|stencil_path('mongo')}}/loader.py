@@ -0,0 +1,140 @@
+__all__ = ["DocumentLoader", "LoaderScopeMiddleware", "loader_scope"]
+
+import asyncio
+import functools
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from beanie import Document, PydanticObjectId
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+type _Memo = dict[tuple[type[Document], PydanticObjectId], asyncio.Future]
+
+_memo: ContextVar[_Memo | None] = ContextVar("document_loader_memo", default=None)
+
+
+@contextmanager
+def loader_scope() -> Iterator[None]:
+    """
+    Remember documents loaded by `DocumentLoader` until the end of the scope (e.g. a request),
+    so that the same id is never fetched twice.
+    """
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+class LoaderScopeMiddleware:
+    """
+    Opens a `loader_scope` for every HTTP request. Add it in `src/api/app.py` once routes read documents
+    through a `DocumentLoader` (e.g. `user_repository.read`), it is not worth its cost otherwise.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with loader_scope():
+            await self.app(scope, receive, send)
+
+
+class DocumentLoader[D: Document]:
+    """
+    DataLoader for documents by id: `load` calls made in the same event loop iteration,
+    even from concurrent requests, are coalesced into one `$in` query.
+
+    Every scope (request) gets its own copy of a document, shared only by the callers of that scope.
+    Outside of a scope, every call gets its own copy.
+    """
+
+    def __init__(self, document: type[D]):
+        self.document = document
+        self._batch: dict[PydanticObjectId, asyncio.Future[D | None]] = {}
+        self._fetches: set[asyncio.Task] = set()
+
+    async def load(self, id: PydanticObjectId) -> D | None:
+        memo = _memo.get()
+        key = (self.document, id)
+        future = memo.get(key) if memo is not None else None
+        if future is None:
+            future = self._copy_of(self._batched(id))
+            if memo is not None:
+                memo[key] = future
+        try:
+            # Shielded: a cancelled caller must not cancel the result for the other callers
+            return await asyncio.shield(future)
+        except BaseException:
+            # A failed or cancelled fetch is not remembered, the next `load` fetches the document again.
+            # A pending one is kept for the other callers if only this caller is cancelled.
+            if memo is not None and future.done() and memo.get(key) is future:
+                del memo[key]
+            raise
+
+    async def load_many(self, ids: list[PydanticObjectId]) -> list[D | None]:
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    def forget(self, id: PydanticObjectId) -> None:
+        """
+        Drop the document from the memo of the current scope, e.g. after it was updated.
+        """
+        memo = _memo.get()
+        if memo is not None:
+            memo.pop((self.document, id), None)
+
+    def _batched(self, id: PydanticObjectId) -> asyncio.Future[D | None]:
+        future = self._batch.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._batch:
+                loop.call_soon(self._dispatch)
+            future = self._batch[id] = loop.create_future()
+        return future
+
+    def _copy_of(self, shared: asyncio.Future[D | None]) -> asyncio.Future[D | None]:
+        # Documents of a batch may be requested by concurrent requests, which must not see each other's changes
+        own: asyncio.Future[D | None] = asyncio.get_running_loop().create_future()
+
+        def resolve(shared: asyncio.Future[D | None]) -> None:
+            if own.done():
+                return
+            if shared.cancelled():
+                own.cancel()
+            elif (e := shared.exception()) is not None:
+                own.set_exception(e)
+            else:
+                document = shared.result()
+                own.set_result(document.model_copy(deep=True) if document is not None else None)
+
+        shared.add_done_callback(resolve)
+        return own
+
+    def _dispatch(self) -> None:
+        batch, self._batch = self._batch, {}
+        task = asyncio.create_task(self._fetch(batch))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+        task.add_done_callback(functools.partial(_cancel_pending, batch))
+
+    async def _fetch(self, batch: dict[PydanticObjectId, asyncio.Future[D | None]]) -> None:
+        try:
+            found = {doc.id: doc async for doc in self.document.find({"_id": {"$in": list(batch)}})}
+        except Exception as e:  # noqa: BLE001, the error is raised in the callers
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for id, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(id))
+
+
+def _cancel_pending(batch: dict[PydanticObjectId, asyncio.Future], task: asyncio.Task) -> None:
+    # A fetch may be cancelled, even before it has started: its callers must not wait forever
+    for future in batch.values():
+        future.cancel()
@@ -0,0 +1,353 @@
+"""
+Per-request tracing: time spent in each middleware, dependency, the handler, response validation and serialization.
+
+Spans are sent in the `Server-Timing` response header and/or exported to a file as OpenTelemetry spans
+(OTLP/JSON lines, the format of the `otlpjsonfile` receiver of OpenTelemetry Collector).
+Enabled by the `tracing` settings, otherwise nothing is instrumented.
+"""
+
+__all__ = ["TracingMiddleware", "enabled", "instrument_app", "span", "trace_dependencies"]
+
+import atexit
+import contextlib
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+import fastapi.routing
+from fastapi import FastAPI
+from fastapi.dependencies.models import Dependant
+from starlette.middleware import Middleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import settings
+
+enabled = settings.tracing.server_timing or settings.tracing.export_path is not None
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+class Span:
+    __slots__ = (
+        "attributes",
+        "end_ns",
+        "error",
+        "inner_start_ns",
+        "is_middleware",
+        "name",
+        "parent",
+        "span_id",
+        "start_ns",
+        "trace_id",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent: "Span | None", attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent = parent
+        self.attributes = attributes
+        self.is_middleware = False
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.inner_start_ns: int | None = None
+        "When the first child span started, for the time a middleware spent before passing the request on"
+        self.error: str | None = None
+
+    def to_otlp(self) -> dict[str, Any]:
+        otlp: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else "",
+            "name": self.name,
+            "kind": SPAN_KIND_SERVER if self.parent is None else SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.error is not None:
+            otlp["status"] = {"code": 2, "message": self.error}  # STATUS_CODE_ERROR
+        return otlp
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_spans: ContextVar[list[Span] | None] = ContextVar("trace_spans", default=None)
+_no_span = contextlib.nullcontext()
+
+
+class _SpanScope:
+    __slots__ = ("_span", "_token")
+
+    def __init__(self, span: Span):
+        self._span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._span.end_ns = time.time_ns()
+        if exc is not None:
+            self._span.error = repr(exc)
+        _current_span.reset(self._token)
+
+
+def span(name: str, **attributes: Any) -> AbstractContextManager[Span | None]:
+    """
+    Measure a part of the request as a child of the current span. Does nothing outside of a traced request.
+    """
+    parent = _current_span.get()
+    spans = _spans.get()
+    if parent is None or spans is None:
+        return _no_span
+    child = Span(name, parent.trace_id, parent, attributes)
+    if parent.inner_start_ns is None:
+        parent.inner_start_ns = child.start_ns
+    spans.append(child)
+    return _SpanScope(child)
+
+
+def _metric_name(name: str) -> str:
+    # Server-Timing metric names are HTTP tokens
+    return re.sub(r"[^\w.!#$%&'*+^`|~-]", "_", name)
+
+
+def server_timing(spans: list[Span]) -> str:
+    """
+    `Server-Timing` header value from the spans measured so far, durations of spans with the same name are summed.
+    Middlewares have not finished when the response starts, so their time before passing the request on is reported.
+    """
+    now = time.time_ns()
+    durations: dict[str, int] = {}
+    root, *children = spans
+    for child in children:
+        if child.end_ns is not None:
+            duration = child.end_ns - child.start_ns
+        elif child.is_middleware:
+            duration = (child.inner_start_ns or now) - child.start_ns
+        else:
+            continue
+        durations[child.name] = durations.get(child.name, 0) + duration
+    durations["total"] = now - root.start_ns
+    return ", ".join(f"{_metric_name(name)};dur={duration / 1e6:.3f}" for name, duration in durations.items())
+
+
+class FileSpanExporter:
+    """
+    Thread that appends finished traces to a file as OTLP/JSON lines: one `ExportTraceServiceRequest` per trace.
+    """
+
+    def __init__(self, path: Path, service_name: str, queue_size: int = 10_000):
+        self.path = path
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self.queue: queue.Queue[list[Span] | None] = queue.Queue(queue_size)
+        self.dropped = 0
+        self._thread: threading.Thread | None = None
+
+    def export(self, spans: list[Span]) -> None:
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def restart_after_fork(self) -> None:
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        if self._thread is not None:
+            self.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            while True:
+                traces = [self.queue.get()]
+                while True:
+                    try:
+                        traces.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                for spans in traces:
+                    if spans is not None:
+                        f.write(json.dumps(self._request(spans), separators=(",", ":")) + "\n")
+                f.flush()
+                if None in traces:
+                    return
+                if self.dropped:
+                    dropped, self.dropped = self.dropped, 0
+                    logging.getLogger("src").warning(f"Dropped {dropped} traces, because the export queue was full")
+
+    def _request(self, spans: list[Span]) -> dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.to_otlp() for s in spans]}],
+                }
+            ]
+        }
+
+
+exporter: FileSpanExporter | None = None
+if settings.tracing.export_path is not None:
+    exporter = FileSpanExporter(settings.tracing.export_path, settings.tracing.service_name)
+    exporter.start()
+    atexit.register(exporter.stop)
+    os.register_at_fork(after_in_child=exporter.restart_after_fork)
+
+
+class TracingMiddleware:
+    """
+    Starts a trace for every HTTP request: the root span covers the whole request, including sending the response.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root = Span(
+            f"{scope['method']} {scope['path']}",
+            f"{random.getrandbits(128):032x}",
+            None,
+            {"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+        spans = [root]
+        spans_token = _spans.set(spans)
+        span_token = _current_span.set(root)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                if self.server_timing:
+                    header = (b"server-timing", server_timing(spans).encode())
+                    message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException as e:
+            root.error = repr(e)
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            _current_span.reset(span_token)
+            _spans.reset(spans_token)
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{scope['method']} {route.path}"
+                root.attributes["http.route"] = route.path
+            if exporter is not None:
+                exporter.export(spans)
+
+
+class TracedMiddleware:
+    """Wraps a middleware into a span"""
+
+    def __init__(self, app: ASGIApp, middleware: Callable[..., ASGIApp], *args: Any, **kwargs: Any):
+        self.name = f"middleware.{getattr(middleware, '__name__', type(middleware).__name__)}"
+        self.app = middleware(app, *args, **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        with span(self.name) as middleware_span:
+            if middleware_span is not None:
+                middleware_span.is_middleware = True
+            await self.app(scope, receive, send)
+
+
+def instrument_app(app: FastAPI) -> None:
+    """
+    Trace the middlewares added so far, and add the tracing middleware outside of them.
+    Also trace the validation and serialization of responses.
+    """
+    app.user_middleware = [Middleware(TracedMiddleware, m.cls, *m.args, **m.kwargs) for m in app.user_middleware]
+    app.add_middleware(TracingMiddleware, server_timing=settings.tracing.server_timing)
+    fastapi.routing.serialize_response = _traced_serialize_response
+
+
+_serialize_response = fastapi.routing.serialize_response
+
+
+async def _traced_serialize_response(**kwargs: Any) -> Any:
+    # Validation and serialization of return values that FastAPI builds responses from
+    with span("response.serialize"):
+        return await _serialize_response(**kwargs)
+
+
+class _TracedCall:
+    """
+    Dependency wrapped into a span. Compares equal to the original callable,
+    so `dependency_overrides` and the per-request dependency cache keep working.
+    """
+
+    def __init__(self, call: Callable[..., Any]):
+        self.__wrapped__ = call
+        self.span_name = f"dependency.{getattr(call, '__name__', type(call).__name__)}"
+
+    def __eq__(self, other: object) -> bool:
+        return self.__wrapped__ == (other.__wrapped__ if isinstance(other, _TracedCall) else other)
+
+    def __hash__(self) -> int:
+        return hash(self.__wrapped__)
+
+
+class _TracedSyncCall(_TracedCall):
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        with span(self.span_name):
+            return self.__wrapped__(*args, **kwargs)
+
+
+class _TracedAsyncCall(_TracedCall):
+    async def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        with span(self.span_name):
+            return await self.__wrapped__(*args, **kwargs)
+
+
+def trace_dependencies(dependant: Dependant) -> None:
+    """
+    Wrap the calls of all (sub-)dependencies into spans. Generator dependencies (with `yield`) are not traced.
+    """
+    for sub_dependant in dependant.dependencies:
+        trace_dependencies(sub_dependant)
+        call = sub_dependant.call
+        if call is None or isinstance(call, _TracedCall):
+            continue
+        if sub_dependant.is_gen_callable or sub_dependant.is_async_gen_callable:
+            continue
+        is_coroutine = sub_dependant.is_coroutine_callable or inspect.iscoroutinefunction(call)
+        sub_dependant.call = _TracedAsyncCall(call) if is_coroutine else _TracedSyncCall(call)
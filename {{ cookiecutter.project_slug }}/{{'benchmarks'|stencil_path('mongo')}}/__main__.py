@@ -0,0 +1,119 @@
+"""
+Benchmark of the API endpoints: `uv run -m benchmarks --help`.
+
+Requests are sent to `src.api.app:app` in-process through the ASGI transport (no server, no network),
+so the numbers show the cost of the application code and MongoDB queries. The benchmark uses a separate database:
+`BENCHMARK_DATABASE_URI` or `database_uri` from settings with the `_benchmarks` suffix, dropped after the run.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import httpx
+from beanie import Document
+from pydantic import SecretStr
+
+from src.prepare import BASE_DIR
+
+os.chdir(BASE_DIR)
+
+from benchmarks.harness import Result, compare, run_scenario, save_results  # noqa: E402
+from benchmarks.scenarios import all_scenarios  # noqa: E402
+from src.api.app import app  # noqa: E402
+from src.api.lifespan import setup_database  # noqa: E402
+from src.config import settings  # noqa: E402
+from src.storages.mongo import document_models  # noqa: E402
+
+RESULTS_PATH = Path(__file__).parent / "results"
+
+
+def benchmark_database_uri() -> str:
+    if uri := os.environ.get("BENCHMARK_DATABASE_URI"):
+        return uri
+    parts = urlsplit(settings.database_uri.get_secret_value())
+    database = parts.path.strip("/") or "test"
+    return parts._replace(path=f"/{database}_benchmarks").geturl()
+
+
+def format_table(results: list[Result]) -> str:
+    lines = [
+        f"{'scenario':<48} {'requests':>8} {'errors':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KiB':>10}"
+    ]
+    for r in results:
+        alloc = f"{r.alloc_peak_kib:10.1f}" if r.alloc_peak_kib is not None else f"{'-':>10}"
+        lines.append(
+            f"{r.name:<48} {r.requests:>8} {r.errors:>6} {r.throughput_rps:>9.1f} "
+            f"{r.p50_ms:>9.2f} {r.p95_ms:>9.2f} {r.p99_ms:>9.2f} {alloc}"
+        )
+    return "\n".join(lines)
+
+
+async def run(args: argparse.Namespace) -> list[Result]:
+    settings.database_uri = SecretStr(benchmark_database_uri())
+    motor_client = await setup_database()
+    for model in document_models:
+        if issubclass(model, Document):
+            await model.delete_all()
+
+    results = []
+    scenarios = [s for s in all_scenarios(uuid.uuid4().hex[:8], args.bulk_sizes) if args.filter in s.name]
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None
+        ) as client:
+            for scenario in scenarios:
+                result = await run_scenario(client, scenario, args.requests, args.concurrency, args.alloc_requests)
+                print(format_table([result]).splitlines()[1], file=sys.stderr)
+                if result.errors:
+                    print(f"  {result.errors} unexpected responses, first: {result.first_error}", file=sys.stderr)
+                results.append(result)
+    finally:
+        if not args.keep_data:
+            await motor_client.drop_database(motor_client.get_database().name)
+        motor_client.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="benchmarks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario (fewer for heavy ones)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument(
+        "--alloc-requests", type=int, default=20, help="Sequential requests per scenario measured with tracemalloc"
+    )
+    parser.add_argument(
+        "--bulk-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[10, 1_000, 10_000],
+        help="Comma-separated numbers of items in bulk requests",
+    )
+    parser.add_argument("--filter", default="", help="Run only scenarios with this substring in the name")
+    parser.add_argument("--output", type=Path, help="Where to save the JSON results (default: benchmarks/results/)")
+    parser.add_argument("--compare", type=Path, help="JSON results of a previous run to compare with")
+    parser.add_argument("--keep-data", action="store_true", help="Do not drop the benchmark database")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app INFO logs (a line per request)")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("src").setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+
+    output = args.output or RESULTS_PATH / f"{datetime.now():%Y-%m-%d_%H-%M-%S}.json"
+    save_results(output, results, {key: str(value) for key, value in vars(args).items()})
+    print(format_table(results))
+    print(f"Saved to {output}")
+    if args.compare:
+        print(f"\nChange against {args.compare}:")
+        print(compare(args.compare, results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+__all__ = ["Result", "Scenario", "compare", "run_scenario", "save_results"]
+
+import asyncio
+import json
+import math
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+type RequestFactory = Callable[[int], tuple[str, str, dict[str, Any]]]
+"Returns (method, url, httpx request kwargs) for the i-th request of a scenario"
+
+
+@dataclass
+class Scenario:
+    name: str
+    "Unique name, results of different runs are compared by it"
+    request: RequestFactory
+    setup: Callable[[httpx.AsyncClient, int], Awaitable[None]] | None = None
+    "Prepares data for the given number of requests (e.g. creates objects to read)"
+    max_requests: int | None = None
+    "Upper bound for the number of requests of the suite, for heavy requests (e.g. bulk ones)"
+    expected_status: int = 200
+
+
+@dataclass
+class Result:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    alloc_peak_kib: float | None = None
+    "Mean peak of memory allocated while handling one request (measured separately with tracemalloc)"
+    first_error: str | None = field(default=None, repr=False)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    # Nearest-rank method
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+async def _send(client: httpx.AsyncClient, scenario: Scenario, i: int) -> httpx.Response:
+    method, url, kwargs = scenario.request(i)
+    return await client.request(method, url, **kwargs)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int, alloc_requests: int
+) -> Result:
+    """
+    Send `requests` requests with up to `concurrency` in flight, then `alloc_requests` sequential requests
+    under tracemalloc (it slows everything down, so latencies are measured without it).
+    """
+    if scenario.max_requests is not None:
+        requests = min(requests, scenario.max_requests)
+    alloc_requests = min(alloc_requests, requests)
+    total = requests + alloc_requests
+    if scenario.setup is not None:
+        await scenario.setup(client, total)
+
+    latencies: list[float] = []
+    errors = 0
+    first_error: str | None = None
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors, first_error
+        for i in counter:
+            started_at = time.perf_counter()
+            response = await _send(client, scenario, i)
+            latencies.append(time.perf_counter() - started_at)
+            if response.status_code != scenario.expected_status:
+                errors += 1
+                first_error = first_error or f"{response.status_code}: {response.text[:200]}"
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started_at
+
+    alloc_peaks: list[int] = []
+    if alloc_requests:
+        tracemalloc.start()
+        try:
+            for i in range(requests, total):
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                await _send(client, scenario, i)
+                _, peak = tracemalloc.get_traced_memory()
+                alloc_peaks.append(peak - before)
+        finally:
+            tracemalloc.stop()
+
+    latencies.sort()
+    return Result(
+        name=scenario.name,
+        requests=requests,
+        concurrency=concurrency,
+        errors=errors,
+        throughput_rps=round(requests / elapsed, 1),
+        p50_ms=round(_percentile(latencies, 50) * 1000, 3),
+        p95_ms=round(_percentile(latencies, 95) * 1000, 3),
+        p99_ms=round(_percentile(latencies, 99) * 1000, 3),
+        mean_ms=round(statistics.fmean(latencies) * 1000, 3),
+        alloc_peak_kib=round(statistics.fmean(alloc_peaks) / 1024, 1) if alloc_peaks else None,
+        first_error=first_error,
+    )
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path: Path, results: list[Result], options: dict[str, Any]) -> None:
+    data = {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": options,
+        },
+        "results": [asdict(result) for result in results],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2))
+
+
+def compare(baseline_path: Path, results: list[Result]) -> str:
+    """
+    Table of relative changes against results saved by a previous run.
+    """
+    baseline = {r["name"]: r for r in json.loads(baseline_path.read_text())["results"]}
+    lines = [f"{'scenario':<48} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'alloc':>9}"]
+    for result in results:
+        before = baseline.get(result.name)
+        if before is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "alloc_peak_kib"):
+            old, new = before.get(key), getattr(result, key)
+            cells.append(f"{(new - old) / old:+9.1%}" if old and new is not None else f"{'-':>9}")
+        lines.append(f"{result.name:<48} " + " ".join(cells))
+    return "\n".join(lines)
@@ -0,0 +1,184 @@
+"""
+JWKS refresh of the Accounts SDK against a stub Accounts API (`httpx.MockTransport`).
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from joserfc import jwt
+from joserfc.jwk import ECKey, RSAKey
+
+from src.modules.inh_accounts_sdk import InNoHassleAccounts
+
+pytestmark = pytest.mark.asyncio
+
+
+class StubJWKSServer:
+    """Serves `/.well-known/jwks.json` with an ETag and counts the requests"""
+
+    def __init__(self, *keys: RSAKey | ECKey):
+        self.keys = list(keys)
+        self.requests = 0
+        self.not_modified = 0
+        self.fail = False
+        self.broken_key = False
+
+    def jwks(self) -> dict:
+        keys = [key.as_dict(private=False) for key in self.keys]
+        if self.broken_key:
+            keys.append({"kty": "RSA", "kid": "broken"})  # without "n" and "e", fails to import
+        return {"keys": keys}
+
+    @property
+    def etag(self) -> str:
+        return f'"{hash(str(self.jwks()))}"'
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith("/.well-known/jwks.json")
+        self.requests += 1
+        if self.fail:
+            return httpx.Response(500)
+        if request.headers.get("If-None-Match") == self.etag:
+            self.not_modified += 1
+            return httpx.Response(304)
+        return httpx.Response(200, json=self.jwks(), headers={"ETag": self.etag})
+
+
+def rsa_key(kid: str = "public") -> RSAKey:
+    return RSAKey.generate_key(2048, parameters={"kid": kid})
+
+
+def token(key: RSAKey) -> str:
+    claims = {"uid": "innohassle-id", "email": "user@innopolis.university", "exp": int(time.time()) + 60}
+    return jwt.encode({"alg": "RS256", "kid": key.kid}, claims, key)
+
+
+def accounts(server: StubJWKSServer, **kwargs) -> InNoHassleAccounts:
+    return InNoHassleAccounts(
+        api_url="http://accounts.test",
+        api_jwt_token="service-token",
+        transport=httpx.MockTransport(server.handler),
+        **kwargs,
+    )
+
+
+async def wait_for(condition, timeout: float = 5) -> None:
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+async def test_not_modified_key_set_is_kept():
+    key = rsa_key()
+    server = StubJWKSServer(key)
+    sdk = accounts(server)
+
+    assert await sdk.update_key_set()
+    assert not await sdk.update_key_set()
+    assert server.not_modified == 1
+    assert sdk.decode_token(token(key)) is not None
+
+
+async def test_keys_other_than_rsa_are_skipped():
+    key = rsa_key()
+    sdk = accounts(StubJWKSServer(key, ECKey.generate_key("P-256", parameters={"kid": "ec"})))
+
+    await sdk.update_key_set()
+    assert list(sdk._public_keys) == ["public"]
+    assert sdk.decode_token(token(key)) is not None
+
+
+async def test_unknown_kid_triggers_refresh():
+    old_key, new_key = rsa_key("old"), rsa_key("new")
+    server = StubJWKSServer(old_key)
+    sdk = accounts(server, key_set_min_refresh_interval=0)
+    await sdk.update_key_set()
+    refresher = asyncio.create_task(sdk.run_key_set_refresher())
+    try:
+        server.keys = [new_key]
+        assert sdk.decode_token(token(new_key)) is None  # rejected until the refresh, without waiting for it
+        await wait_for(lambda: "new" in sdk._public_keys)
+        assert sdk.decode_token(token(new_key)) is not None
+        assert sdk.decode_token(token(old_key)) is None
+    finally:
+        refresher.cancel()
+        await asyncio.gather(refresher, return_exceptions=True)
+        await sdk.aclose()
+
+
+async def test_key_rotated_under_the_same_kid_invalidates_verified_tokens():
+    old_key, new_key = rsa_key(), rsa_key()
+    server = StubJWKSServer(old_key)
+    sdk = accounts(server)
+    await sdk.update_key_set()
+    old_token = token(old_key)
+    assert sdk.decode_token(old_token) is not None
+
+    server.keys = [new_key]
+    assert await sdk.update_key_set()
+    assert sdk.decode_token(old_token) is None
+    assert sdk.decode_token(token(new_key)) is not None
+
+
+async def test_on_demand_refresh_is_rate_limited():
+    server = StubJWKSServer(rsa_key())
+    sdk = accounts(server, key_set_min_refresh_interval=60)
+    await sdk.update_key_set()
+
+    for _ in range(10):
+        assert sdk.decode_token(token(rsa_key("unknown"))) is None
+    assert not sdk._key_set_refresh_requested.is_set()
+    assert server.requests == 1
+
+
+async def test_refresher_survives_failures():
+    key = rsa_key()
+    server = StubJWKSServer(key)
+    sdk = accounts(server, key_set_min_refresh_interval=0)
+    await sdk.update_key_set()
+    refresher = asyncio.create_task(sdk.run_key_set_refresher())
+    try:
+        server.fail = True
+        sdk.request_key_set_refresh()
+        await wait_for(lambda: server.requests == 2)
+        server.fail = False
+        server.broken_key = True
+        sdk.request_key_set_refresh()
+        await wait_for(lambda: server.requests == 3)
+
+        server.broken_key = False
+        server.keys = [key, rsa_key("next")]
+        sdk.request_key_set_refresh()
+        await wait_for(lambda: "next" in sdk._public_keys)
+        assert not refresher.done()
+    finally:
+        refresher.cancel()
+        await asyncio.gather(refresher, return_exceptions=True)
+        await sdk.aclose()
+
+
+async def test_concurrent_lookups_finish_all_requests():
+    finished = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.startswith("/users/by-id/"):
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json={"id": "innohassle-id", "innopolis_info": {"email": "e", "updated_at": 0}})
+        try:
+            await asyncio.sleep(10)
+        finally:
+            finished.append(request.url.path)
+        return httpx.Response(404)
+
+    sdk = InNoHassleAccounts(
+        api_url="http://accounts.test",
+        api_jwt_token="service-token",
+        transport=httpx.MockTransport(handler),
+        concurrent_lookups=True,
+    )
+    user = await sdk.get_user(innohassle_id="innohassle-id", email="e", telegram_id=1)
+    assert user is not None and user.id == "innohassle-id"
+    assert sorted(finished) == ["/users/by-innomail/e", "/users/by-telegram-id/1"]  # cancelled before returning
+    await sdk.aclose()